@@ -0,0 +1,61 @@
+-- Per-source aggregates. Incremental runs only recompute sources that
+-- received new chunks since the last run.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['collection', 'source'],
+        incremental_strategy='delete+insert'
+    )
+}}
+
+-- Same lookback as stg_embedding_chunks so late-committed chunks are recounted
+{% set watermark %}
+    ((select coalesce(max(last_processed_at), '1970-01-01'::timestamp) from {{ this }}) - interval '{{ var("corpus_lookback_minutes") }} minutes')
+{% endset %}
+
+with touched_sources as (
+    select collection, source
+    from {{ ref('stg_embedding_chunks') }}
+    {% if is_incremental() %}
+    where processed_at > {{ watermark }}
+    {% endif %}
+
+    union
+
+    -- Linked near-duplicates add no embedding rows but still change the stats
+    select collection, source
+    from {{ source('vector_store', 'embedding_signatures') }}
+    where canonical_hash is not null
+    {% if is_incremental() %}
+    and created_at > {{ watermark }}
+    {% endif %}
+),
+
+chunks as (
+    select c.*
+    from {{ ref('stg_embedding_chunks') }} c
+    join touched_sources t using (collection, source)
+),
+
+links as (
+    select s.collection, s.source, count(*) as near_duplicates_linked
+    from {{ source('vector_store', 'embedding_signatures') }} s
+    join touched_sources t using (collection, source)
+    where s.canonical_hash is not null
+    group by s.collection, s.source
+)
+
+select
+    chunks.collection,
+    chunks.source,
+    max(chunks.source_type) as source_type,
+    count(*) as chunk_count,
+    count(distinct chunks.version) as version_count,
+    sum(chunks.content_bytes) as content_bytes,
+    avg(chunks.content_chars)::numeric(12, 1) as avg_chunk_chars,
+    coalesce(max(links.near_duplicates_linked), 0) as near_duplicates_linked,
+    min(chunks.processed_at) as first_processed_at,
+    max(chunks.processed_at) as last_processed_at
+from chunks
+left join links using (collection, source)
+group by chunks.collection, chunks.source
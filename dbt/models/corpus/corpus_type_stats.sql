@@ -0,0 +1,13 @@
+-- Per-collection, per-type rollup of the source aggregates
+{{ config(materialized='table') }}
+
+select
+    collection,
+    source_type,
+    count(*) as source_count,
+    sum(chunk_count) as chunk_count,
+    sum(content_bytes) as content_bytes,
+    sum(near_duplicates_linked) as near_duplicates_linked,
+    max(last_processed_at) as last_processed_at
+from {{ ref('corpus_source_stats') }}
+group by collection, source_type
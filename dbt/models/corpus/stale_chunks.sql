@@ -0,0 +1,37 @@
+-- Chunks superseded by a later ingest of the same source: a chunk is stale
+-- when the same (collection, source, chunk_index) was stored again afterwards.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['collection', 'document_hash'],
+        incremental_strategy='delete+insert'
+    )
+}}
+
+with touched_sources as (
+    select distinct collection, source
+    from {{ ref('stg_embedding_chunks') }}
+    {% if is_incremental() %}
+    where processed_at > (select coalesce(max(superseded_at), '1970-01-01'::timestamp) from {{ this }}) - interval '{{ var("corpus_lookback_minutes") }} minutes'
+    {% endif %}
+),
+
+ranked as (
+    select
+        c.collection,
+        c.document_hash,
+        c.source,
+        c.chunk_index,
+        c.version,
+        c.processed_at,
+        max(c.processed_at) over (
+            partition by c.collection, c.source, c.chunk_index
+        ) as superseded_at
+    from {{ ref('stg_embedding_chunks') }} c
+    join touched_sources t using (collection, source)
+    where c.chunk_index is not null
+)
+
+select collection, document_hash, source, chunk_index, version, processed_at, superseded_at
+from ranked
+where processed_at < superseded_at
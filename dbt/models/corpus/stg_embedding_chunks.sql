@@ -0,0 +1,33 @@
+-- Slim, vector-free copy of the embeddings table. Every downstream corpus
+-- model reads from here instead of scanning the vector partitions.
+{{
+    config(
+        materialized='incremental',
+        unique_key=['collection', 'document_hash'],
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['collection', 'source']},
+            {'columns': ['processed_at']}
+        ]
+    )
+}}
+
+select
+    collection,
+    document_hash,
+    source,
+    source_type,
+    coalesce(metadata->>'type', metadata->>'file_type', source_type) as content_type,
+    (metadata->>'chunk_index')::int as chunk_index,
+    version,
+    length(content) as content_chars,
+    octet_length(content) as content_bytes,
+    processed_at
+from {{ source('vector_store', 'embeddings') }}
+
+{% if is_incremental() %}
+-- processed_at is stamped before the row commits, so a row can land with a
+-- timestamp below the watermark; re-scan a lookback window to pick it up
+-- (delete+insert on the unique key makes the overlap idempotent)
+where processed_at > (select coalesce(max(processed_at), '1970-01-01'::timestamp) from {{ this }}) - interval '{{ var("corpus_lookback_minutes") }} minutes'
+{% endif %}
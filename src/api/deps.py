@@ -0,0 +1,15 @@
+from fastapi import Request
+from services.data_processor import DataProcessorService
+from services.retrieval_service import RetrievalService
+from services.corpus_stats_service import CorpusStatsService
+
+# Services are built once in the app lifespan (see main.py) and shared by all requests
+
+def get_data_processor(request: Request) -> DataProcessorService:
+    return request.app.state.data_processor
+
+def get_retrieval_service(request: Request) -> RetrievalService:
+    return request.app.state.retrieval_service
+
+def get_stats_service(request: Request) -> CorpusStatsService:
+    return request.app.state.stats_service
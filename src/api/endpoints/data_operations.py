@@ -1,17 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends
+from fastapi.responses import JSONResponse
+from typing import List, Dict, Any, Optional
 from services.data_processor import DataProcessorService
 from core.config import settings
 from processors.processor_registry import ProcessorRegistry
+from api.deps import get_data_processor
 
 router = APIRouter()
-data_processor = DataProcessorService()
+
+def _upload_response(results: List[Dict[str, Any]], **extra) -> JSONResponse:
+    """Report success only if every file succeeded: 207 when some failed, 422 when all did"""
+    statuses = [result["status"] for result in results]
+    if all(status == "success" for status in statuses):
+        status, status_code = "success", 200
+    elif all(status == "error" for status in statuses):
+        status, status_code = "failed", 422
+    else:
+        status, status_code = "partial", 207
+    return JSONResponse(status_code=status_code, content={"status": status, "results": results, **extra})
 
 @router.post("/upload/{source_type}")
 async def upload_data(
     source_type: str,
     files: List[UploadFile] = File(...),
-    process_type: Optional[str] = Query(None, description="Specific processing type")
+    process_type: Optional[str] = Query(None, description="Specific processing type"),
+    collection: str = Query("default", description="Collection (tenant) the embeddings are stored in"),
+    data_processor: DataProcessorService = Depends(get_data_processor)
 ):
     """
     Upload and process data from various sources
@@ -20,6 +34,7 @@ async def upload_data(
         source_type: Type of data source (csv, json, xml, etc.)
         files: List of files to process
         process_type: Optional specific processing type
+        collection: Collection/tenant partition to store the embeddings in
     """
     # Validate source_type is supported
     supported_types = {ext.lstrip('.') for processor in ProcessorRegistry._processors.values() 
@@ -34,10 +49,45 @@ async def upload_data(
         results = await data_processor.process_files(
             files=files,
             source_type=source_type,
-            process_type=process_type
+            process_type=process_type,
+            collection=collection
         )
-        return {"status": "success", "results": results}
+        return _upload_response(results)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/upload-archive")
+async def upload_archive(
+    file: UploadFile = File(...),
+    process_type: Optional[str] = Query(None, description="Specific processing type"),
+    collection: str = Query("default", description="Collection (tenant) the embeddings are stored in"),
+    data_processor: DataProcessorService = Depends(get_data_processor)
+):
+    """
+    Upload a zip archive or JSON directory manifest and process every supported file in parallel
+    
+    Args:
+        file: A .zip archive, or a .json manifest {"directory": ..., "files": [...]} relative to INGEST_ROOT
+        process_type: Optional specific processing type applied to every file
+        collection: Collection/tenant partition to store the embeddings in
+    """
+    try:
+        results = await data_processor.process_archive(
+            file=file,
+            process_type=process_type,
+            collection=collection
+        )
+        return _upload_response(results["results"], skipped=results["skipped"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dedup/stats")
+async def dedup_stats(data_processor: DataProcessorService = Depends(get_data_processor)):
+    """
+    Return cumulative near-duplicate detection savings (embedding calls and rows).
+    """
+    return data_processor.dedup_service.get_stats()
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Request
+import asyncio
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+@router.get("/live")
+async def live():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def ready(request: Request):
+    """
+    Readiness probe: warm-up has finished and the database answers.
+    """
+    state = request.app.state
+    warmed_up = getattr(state, "ready", False)
+    database = warmed_up and await asyncio.to_thread(state.embedding_service.ping)
+    body = {
+        "status": "ready" if database else "not_ready",
+        "warmed_up": warmed_up,
+        "database": database,
+        "startup_seconds": getattr(state, "startup_seconds", None),
+        "warmup_seconds": getattr(state, "warmup_seconds", None),
+        "warmup_error": getattr(state, "warmup_error", None)
+    }
+    return JSONResponse(status_code=200 if database else 503, content=body)
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import Optional
 from services.retrieval_service import RetrievalService
+from api.deps import get_retrieval_service
 
 router = APIRouter()
-retrieval_service = RetrievalService()
 
 @router.get("/search")
 async def search(
     query: str,
     max_results: Optional[int] = Query(default=5, gt=0, le=20),
-    similarity_threshold: Optional[float] = Query(default=0.7, gt=0, le=1.0)
+    similarity_threshold: Optional[float] = Query(default=0.7, gt=0, le=1.0),
+    collection: Optional[str] = Query(default=None, description="Restrict search to one collection"),
+    fetch_k: Optional[int] = Query(default=None, gt=0, le=200, description="Candidate pool size for reranking"),
+    mmr_lambda: Optional[float] = Query(default=None, ge=0, le=1.0, alias="lambda"),
+    max_per_source: Optional[int] = Query(default=None, gt=0, le=20),
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
 ):
     """
     Search across documents using semantic search with RAG.
@@ -18,17 +23,36 @@ async def search(
     - query: Search query string
     - max_results: Maximum number of results to return (default: 5)
     - similarity_threshold: Minimum similarity score threshold (default: 0.7)
+    - collection: Only search this collection's partition (default: all collections)
+    - fetch_k: Rerank this many candidates with MMR (default: 4x max_results when reranking)
+    - lambda: MMR relevance/diversity trade-off, 1.0 = pure relevance
+      (default: 0.5 when fetch_k is set, otherwise 1.0)
+    - max_per_source: Maximum results taken from a single source; on its own it only
+      caps sources and keeps results in relevance order
     """
     try:
         results = await retrieval_service.semantic_search(
             query=query,
             limit=max_results,
-            threshold=similarity_threshold
+            threshold=similarity_threshold,
+            collection=collection,
+            fetch_k=fetch_k,
+            mmr_lambda=mmr_lambda,
+            max_per_source=max_per_source
         )
         return {
             "query": query,
             "results": results,
             "result_count": len(results)
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats")
+async def cache_stats(retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    """
+    Return semantic query cache metrics (hit rate, size, evictions).
+    """
+    return retrieval_service.get_cache_stats()
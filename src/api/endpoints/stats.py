@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
+from services.corpus_stats_service import CorpusStatsService
+from api.deps import get_stats_service
+
+router = APIRouter()
+
+@router.get("/sources")
+async def source_stats(
+    collection: Optional[str] = Query(default=None, description="Restrict to one collection"),
+    limit: int = Query(default=100, gt=0, le=1000),
+    stats_service: CorpusStatsService = Depends(get_stats_service)
+):
+    """
+    Per-source corpus statistics, read from the incremental dbt models.
+    """
+    try:
+        results = stats_service.get_source_stats(collection=collection, limit=limit)
+        return {"results": results, "result_count": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/types")
+async def type_stats(
+    collection: Optional[str] = Query(default=None, description="Restrict to one collection"),
+    stats_service: CorpusStatsService = Depends(get_stats_service)
+):
+    """
+    Corpus statistics per source type.
+    """
+    try:
+        results = stats_service.get_type_stats(collection=collection)
+        return {"results": results, "result_count": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stale")
+async def stale_chunks(
+    collection: Optional[str] = Query(default=None, description="Restrict to one collection"),
+    limit: int = Query(default=100, gt=0, le=1000),
+    stats_service: CorpusStatsService = Depends(get_stats_service)
+):
+    """
+    Chunks superseded by a newer ingest of the same source.
+    """
+    try:
+        results = stats_service.get_stale_chunks(collection=collection, limit=limit)
+        return {"results": results, "result_count": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from .endpoints import data_operations, retrieval
+from .endpoints import data_operations, retrieval, stats, health
 
 # Main API Router
 api_router = APIRouter()
@@ -15,4 +15,16 @@ api_router.include_router(
     retrieval.router,
     prefix="/retrieve",
     tags=["retrieval"]
-) 
\ No newline at end of file
+)
+
+api_router.include_router(
+    stats.router,
+    prefix="/stats",
+    tags=["corpus-stats"]
+)
+
+api_router.include_router(
+    health.router,
+    prefix="/health",
+    tags=["health"]
+)
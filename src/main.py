@@ -1,14 +1,75 @@
 # src/main.py
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from api.router import api_router
 from core.config import settings
+from services.embedding_service import EmbeddingService
+from services.data_processor import DataProcessorService
+from services.retrieval_service import RetrievalService
+from services.corpus_stats_service import CorpusStatsService
+
+def _warm_up_once(app: FastAPI):
+    """Blocking warm-up: wait for the DB, prefill the pool, prewarm search indexes"""
+    app.state.embedding_service.warm_up()
+    app.state.retrieval_service.warm_up()
+
+async def _warm_up(app: FastAPI):
+    """Retry warm-up with exponential backoff until it succeeds or the app shuts down"""
+    started = time.perf_counter()
+    delay = 1.0
+    max_delay = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+    while True:
+        try:
+            await asyncio.to_thread(_warm_up_once, app)
+            break
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            print(f"Warm-up failed, retrying in {delay}s: {str(e)}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+    app.state.ready = True
+    app.state.warmup_error = None
+    app.state.warmup_seconds = round(time.perf_counter() - started, 3)
+    print(f"Warm-up finished in {app.state.warmup_seconds}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+
+    # One embedding client and connection pool shared by every service
+    embedding_service = EmbeddingService()
+    app.state.embedding_service = embedding_service
+    app.state.data_processor = DataProcessorService(embedding_service=embedding_service)
+    app.state.retrieval_service = RetrievalService(embedding_service=embedding_service)
+    app.state.stats_service = CorpusStatsService()
+    app.state.ready = False
+    app.state.warmup_error = None
+    app.state.warmup_seconds = None
+
+    # Serve liveness immediately; readiness flips once warm-up completes
+    warm_up = asyncio.create_task(_warm_up(app))
+    app.state.startup_seconds = round(time.perf_counter() - started, 3)
+    print(f"Startup finished in {app.state.startup_seconds}s")
+
+    yield
+
+    # Do not hang shutdown on a warm-up still waiting for the database
+    warm_up.cancel()
+    await asyncio.wait({warm_up}, timeout=float(os.getenv("WARMUP_SHUTDOWN_TIMEOUT_SECONDS", "5")))
+    app.state.data_processor.executor.shutdown()
+    embedding_service.close()
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title=settings.PROJECT_NAME,
         description="Enterprise Graph RAG API",
-        version=settings.VERSION
+        version=settings.VERSION,
+        lifespan=lifespan
     )
     
     # Include main API router
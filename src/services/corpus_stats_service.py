@@ -0,0 +1,54 @@
+from typing import List, Dict, Any, Optional
+import os
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from utils.db import get_db_params
+
+class CorpusStatsService:
+    """Read corpus health figures from the precomputed dbt models.
+
+    ``corpus_source_stats``, ``corpus_type_stats`` and ``stale_chunks`` are
+    maintained incrementally by ``dbt run`` (see ``dbt/models/corpus``), so
+    these queries never touch the vector partitions.
+    """
+
+    def __init__(self):
+        self.db_params = get_db_params()
+        self.schema = os.getenv("DBT_SCHEMA", "permanent")
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with psycopg2.connect(**self.db_params) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(sql.format(schema=self.schema), params)
+                return [dict(row) for row in cur.fetchall()]
+
+    def get_source_stats(self, collection: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Per-source chunk counts, sizes and near-duplicate links, largest first"""
+        return self._query("""
+            SELECT collection, source, source_type, chunk_count, version_count, content_bytes,
+                   avg_chunk_chars, near_duplicates_linked, first_processed_at, last_processed_at
+            FROM {schema}.corpus_source_stats
+            WHERE %s IS NULL OR collection = %s
+            ORDER BY chunk_count DESC
+            LIMIT %s
+        """, (collection, collection, limit))
+
+    def get_type_stats(self, collection: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Chunk counts and sizes per source type"""
+        return self._query("""
+            SELECT collection, source_type, source_count, chunk_count, content_bytes,
+                   near_duplicates_linked, last_processed_at
+            FROM {schema}.corpus_type_stats
+            WHERE %s IS NULL OR collection = %s
+            ORDER BY collection, content_bytes DESC
+        """, (collection, collection))
+
+    def get_stale_chunks(self, collection: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Chunks superseded by a newer ingest of the same source"""
+        return self._query("""
+            SELECT collection, document_hash, source, chunk_index, version, processed_at, superseded_at
+            FROM {schema}.stale_chunks
+            WHERE %s IS NULL OR collection = %s
+            ORDER BY superseded_at DESC
+            LIMIT %s
+        """, (collection, collection, limit))
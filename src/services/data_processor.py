@@ -1,58 +1,240 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import UploadFile
+import asyncio
+import json
 import os
+import shutil
+import tempfile
+import zipfile
 from .embedding_service import EmbeddingService
+from .dedup_service import NearDuplicateService, DedupBatch
+from .ingestion_executor import IngestionExecutor
+from .partitioning import DEFAULT_COLLECTION, validate_collection, source_type_of
 from processors.registry import ProcessorRegistry
 
 class DataProcessorService:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.dedup_service = NearDuplicateService()
+        self.executor = IngestionExecutor()
+        self.max_archive_bytes = int(os.getenv("INGEST_MAX_ARCHIVE_BYTES", str(1024 ** 3)))
+        self.ingest_root = os.getenv("INGEST_ROOT")
+
+    def _store_chunks(
+        self,
+        filename: str,
+        chunks: List[Dict[str, Any]],
+        collection: str,
+        batch: DedupBatch
+    ) -> Dict[str, Any]:
+        """Deduplicate, embed and store the chunks of one file (blocking)"""
+        # Number chunks before any are filtered out: stale_chunks matches re-ingested
+        # chunks by position, and only some processors set chunk_index themselves
+        chunks = [
+            {**chunk, "metadata": {"chunk_index": i, **(chunk.get("metadata") or {})}}
+            for i, chunk in enumerate(chunks)
+        ]
+
+        # Drop or link near-duplicate chunks before paying for their embeddings; the
+        # shared batch serialises this step across the upload's files, embedding is not
+        dedup = self.dedup_service.filter_chunks(
+            chunks, source=filename, source_type=source_type_of(filename), collection=collection, batch=batch
+        )
+
+        # Generate embeddings and store in vector DB
+        kept_hashes = {chunk["document_hash"] for chunk in dedup["chunks"]}
+        try:
+            stored = self._embed_and_store(filename, dedup["chunks"], collection)
+        except Exception:
+            # Siblings waiting on these canonicals must not wait for the timeout
+            batch.resolve(set(), kept_hashes)
+            raise
+        stored_hashes = set(stored["stored_hashes"])
+        inserted_count = stored["inserted_count"]
+        batch.resolve(stored_hashes, kept_hashes - stored_hashes)
+
+        # A near-duplicate of a chunk kept elsewhere in this upload is only dropped
+        # once that canonical is stored; otherwise it is embedded after all
+        unstored = batch.unstored({dup["canonical_hash"] for dup in dedup["batch_duplicates"]})
+        restored = [dup for dup in dedup["batch_duplicates"] if dup["canonical_hash"] in unstored]
+        if restored:
+            stored = self._embed_and_store(filename, restored, collection)
+            stored_hashes |= stored["stored_hashes"]
+            inserted_count += stored["inserted_count"]
+        restored_hashes = {dup["document_hash"] for dup in restored}
+        dedup["report"]["restored"] = len(restored)
+
+        # Only index signatures of rows that made it into the table
+        failed_hashes = (kept_hashes | restored_hashes) - stored_hashes
+        self.dedup_service.register(
+            [chunk for chunk in dedup["chunks"] + restored if chunk["document_hash"] in stored_hashes],
+            [link for link in dedup["links"] if link["document_hash"] not in restored_hashes],
+            source=filename,
+            collection=collection
+        )
+
+        return {
+            "status": "partial" if failed_hashes else "success",
+            "collection": collection,
+            "embeddings_stored": inserted_count,
+            "embeddings_failed": len(failed_hashes),
+            "near_duplicates": dedup["report"]
+        }
+
+    def _embed_and_store(self, filename: str, chunks: List[Dict[str, Any]], collection: str) -> Dict[str, Any]:
+        documents = [
+            self.embedding_service.process_content(
+                chunk["content"], chunk["metadata"], filename, collection=collection
+            )
+            for chunk in chunks
+        ]
+        return self.embedding_service.store_embeddings(documents)
+
+    async def _ingest(
+        self,
+        files: List[Tuple[str, str]],
+        process_type: Optional[str],
+        collection: str
+    ) -> List[Dict[str, Any]]:
+        batch = DedupBatch()
+        return await self.executor.run(
+            files,
+            process_type,
+            lambda filename, chunks: self._store_chunks(filename, chunks, collection, batch)
+        )
+
+    @staticmethod
+    def _validate_process_type(file_ext: str, process_type: Optional[str]):
+        processor = ProcessorRegistry.get_processor(file_ext)
+        if process_type and process_type not in processor.get_supported_process_types():
+            raise ValueError(
+                f"Unsupported process type '{process_type}' for {file_ext} files. "
+                f"Supported types: {', '.join(processor.get_supported_process_types())}"
+            )
 
     async def process_files(
         self,
         files: List[UploadFile],
         source_type: str,
-        process_type: Optional[str] = None
+        process_type: Optional[str] = None,
+        collection: str = DEFAULT_COLLECTION
     ) -> List[Dict[str, Any]]:
         """Process uploaded files based on their source type and optional process type"""
-        results = []
-        
+        collection = validate_collection(collection)
+
         for file in files:
             # Validate file extension matches source_type
             file_ext = os.path.splitext(file.filename)[1].lower()
             if not file_ext.lstrip('.') == source_type.lower():
                 raise ValueError(f"File {file.filename} does not match source type {source_type}")
+        self._validate_process_type(f".{source_type.lower()}", process_type)
+
+        # Save files to a per-request directory so concurrent uploads never collide
+        temp_dir = tempfile.mkdtemp(prefix="ingest_")
+        try:
+            saved = []
+            for i, file in enumerate(files):
+                # One subdirectory per upload keeps same-named files apart and the original
+                # basename intact, since processors copy the path into chunk metadata
+                file_dir = os.path.join(temp_dir, str(i))
+                os.makedirs(file_dir)
+                temp_path = os.path.join(file_dir, os.path.basename(file.filename))
+                # Spooled uploads may live on disk; copy off the event loop
+                await asyncio.to_thread(self._save_upload, file, temp_path)
+                saved.append((file.filename, temp_path))
+
+            return await self._ingest(saved, process_type, collection)
+        finally:
+            # Clean up temp files
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    async def process_archive(
+        self,
+        file: UploadFile,
+        process_type: Optional[str] = None,
+        collection: str = DEFAULT_COLLECTION
+    ) -> Dict[str, Any]:
+        """Process a zip archive or a JSON directory manifest uploaded as a single file.
+
+        Every supported file inside is ingested in parallel; unsupported files
+        are listed as skipped.
+        """
+        collection = validate_collection(collection)
+        file_ext = os.path.splitext(file.filename)[1].lower()
+
+        temp_dir = tempfile.mkdtemp(prefix="ingest_")
+        try:
+            if file_ext == ".zip":
+                candidates = await asyncio.to_thread(self._extract_archive, file, temp_dir)
+            elif file_ext == ".json":
+                candidates = await asyncio.to_thread(self._read_manifest, file)
+            else:
+                raise ValueError(f"Archive uploads must be .zip or .json manifests, got {file.filename}")
+
+            supported, skipped = [], []
+            for filename, path in candidates:
+                try:
+                    ProcessorRegistry.get_processor(os.path.splitext(filename)[1])
+                    supported.append((filename, path))
+                except ValueError:
+                    skipped.append(filename)
+
+            results = await self._ingest(supported, process_type, collection)
+            return {"results": results, "skipped": skipped}
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _save_upload(file: UploadFile, path: str):
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+
+    def _extract_archive(self, file: UploadFile, temp_dir: str) -> List[Tuple[str, str]]:
+        """Safely extract regular files from a zip upload into temp_dir (blocking)"""
+        archive_path = os.path.join(temp_dir, "upload.zip")
+        self._save_upload(file, archive_path)
+
+        extract_dir = os.path.join(temp_dir, "files")
+        extracted = []
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir()]
+            if sum(m.file_size for m in members) > self.max_archive_bytes:
+                raise ValueError(f"Archive expands beyond {self.max_archive_bytes} bytes")
+            for member in members:
+                target = os.path.realpath(os.path.join(extract_dir, member.filename))
+                if not target.startswith(os.path.realpath(extract_dir) + os.sep):
+                    raise ValueError(f"Unsafe path in archive: {member.filename}")
+                archive.extract(member, extract_dir)
+                extracted.append((member.filename, target))
+        return extracted
+
+    def _read_manifest(self, file: UploadFile) -> List[Tuple[str, str]]:
+        """Resolve a manifest like {"directory": "contracts", "files": [...]} under INGEST_ROOT (blocking)"""
+        if not self.ingest_root:
+            raise ValueError("Directory manifests are disabled: INGEST_ROOT is not configured")
+        try:
+            manifest = json.load(file.file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid manifest: {e}")
+
+        root = os.path.realpath(self.ingest_root)
+        directory = os.path.realpath(os.path.join(root, manifest.get("directory", ".")))
+        if directory != root and not directory.startswith(root + os.sep):
+            raise ValueError("Manifest directory must be inside INGEST_ROOT")
+
+        if "files" in manifest:
+            relative_paths = manifest["files"]
+        else:
+            relative_paths = [
+                os.path.relpath(os.path.join(dirpath, name), directory)
+                for dirpath, _, names in os.walk(directory)
+                for name in sorted(names)
+            ]
 
-            # Save file temporarily
-            temp_path = f"/tmp/{file.filename}"
-            with open(temp_path, "wb") as f:
-                content = await file.read()
-                f.write(content)
-
-            try:
-                # Process file based on source type
-                processor = ProcessorRegistry.get_processor(file_ext)()
-                
-                # Validate process_type if provided
-                if process_type and process_type not in processor.get_supported_process_types():
-                    raise ValueError(
-                        f"Unsupported process type '{process_type}' for {file_ext} files. "
-                        f"Supported types: {', '.join(processor.get_supported_process_types())}"
-                    )
-                
-                processed_data = processor.process(temp_path, process_type=process_type)
-
-                # Generate embeddings and store in vector DB
-                embedding_count = self.embedding_service.process_and_store_file(temp_path)
-
-                results.append({
-                    "filename": file.filename,
-                    "embeddings_stored": embedding_count
-                })
-
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-
-        return results 
\ No newline at end of file
+        resolved = []
+        for relative_path in relative_paths:
+            path = os.path.realpath(os.path.join(directory, relative_path))
+            if not path.startswith(directory + os.sep) or not os.path.isfile(path):
+                raise ValueError(f"Manifest entry not found inside directory: {relative_path}")
+            resolved.append((relative_path, path))
+        return resolved
@@ -0,0 +1,313 @@
+from typing import List, Dict, Any, Optional, Set, Tuple
+import hashlib
+import re
+import os
+import threading
+import numpy as np
+import psycopg2
+from utils.db import get_db_params
+from .partitioning import DEFAULT_COLLECTION
+
+SIMHASH_BITS = 64
+LSH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // LSH_BANDS
+POLICIES = {'skip', 'link', 'keep'}
+
+def _parse_policies(spec: str) -> Dict[str, str]:
+    """Parse 'pdf:skip,docx:link' into a source type -> policy mapping"""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        source_type, _, policy = item.partition(':')
+        policy = policy.strip().lower()
+        if policy not in POLICIES:
+            raise ValueError(f"Unsupported near-duplicate policy '{policy}' for {source_type}")
+        policies[source_type.strip().lower().lstrip('.')] = policy
+    return policies
+
+def compute_simhash(content: str, shingle_size: int = 3) -> int:
+    """Compute a 64-bit SimHash over word shingles of the normalised content"""
+    tokens = re.findall(r'\w+', content.lower())
+    if len(tokens) >= shingle_size:
+        shingles = [' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    else:
+        shingles = [' '.join(tokens)]
+
+    digests = b''.join(hashlib.md5(s.encode()).digest()[:8] for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    votes = (2 * bits.astype(np.int32) - 1).sum(axis=0)
+    packed = np.packbits(votes > 0)
+    return int.from_bytes(packed.tobytes(), 'big')
+
+def lsh_bands(simhash: int) -> List[int]:
+    """Split a signature into bands; signatures within LSH_BANDS - 1 bits share a band"""
+    mask = (1 << BAND_BITS) - 1
+    return [(simhash >> (i * BAND_BITS)) & mask for i in range(LSH_BANDS)]
+
+def _to_signed(value: int) -> int:
+    """Map an unsigned 64-bit value onto Postgres BIGINT"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _hamming(signature: int, others: np.ndarray) -> np.ndarray:
+    """Vectorized Hamming distance between one signature and an array of uint64 signatures"""
+    xor = np.bitwise_xor(others, np.uint64(signature))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class DedupBatch:
+    """Signatures of the chunks kept so far by the files of one upload.
+
+    A file may match a chunk that a sibling kept but has not stored yet, so
+    each file reports which of its kept chunks were stored (``resolve``), and
+    near-duplicates of a batch chunk are only dropped once that chunk is known
+    to be stored (``unstored``).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._resolved = threading.Condition(self.lock)
+        self.hashes: List[str] = []
+        self.signatures: List[int] = []
+        self.stored: Set[str] = set()
+        self.failed: Set[str] = set()
+
+    def resolve(self, stored: Set[str], failed: Set[str]):
+        with self._resolved:
+            self.stored |= stored
+            self.failed |= failed - stored
+            self._resolved.notify_all()
+
+    def unstored(self, hashes: Set[str], timeout: float = 300) -> Set[str]:
+        """Wait until every hash is resolved and return those that were not stored"""
+        with self._resolved:
+            self._resolved.wait_for(lambda: hashes <= self.stored | self.failed, timeout)
+            return hashes - self.stored
+
+class NearDuplicateService:
+    """Detect near-duplicate chunks before they are embedded.
+
+    Each chunk gets a SimHash signature; candidate matches are found through an
+    LSH band index persisted in ``<schema>.embedding_signatures`` next to the
+    embeddings table, then confirmed by Hamming distance. What happens to a
+    near-duplicate depends on the policy configured for its source type:
+
+    - skip: drop the chunk entirely
+    - link: do not embed it, record a pointer to the canonical chunk instead
+    - keep: embed and store it as usual (the default; skip and link are opt-in)
+
+    Stored chunks from the same ``source`` are never treated as canonicals, so
+    re-uploading an edited file stores its revised chunks instead of matching
+    them against the previous version.
+    """
+
+    def __init__(
+        self,
+        max_distance: Optional[int] = None,
+        policies: Optional[Dict[str, str]] = None,
+        default_policy: Optional[str] = None
+    ):
+        self.db_params = get_db_params()
+        self.schema = os.getenv("DBT_SCHEMA", "permanent")
+        self.max_distance = max_distance if max_distance is not None else int(
+            os.getenv("NEAR_DUP_MAX_DISTANCE", "3")
+        )
+        if not 0 <= self.max_distance < LSH_BANDS:
+            # Pigeonhole guarantee of the band index only holds below LSH_BANDS
+            raise ValueError(f"max_distance must be between 0 and {LSH_BANDS - 1}")
+        self.policies = policies if policies is not None else _parse_policies(
+            os.getenv("NEAR_DUP_POLICIES", "")
+        )
+        self.default_policy = (default_policy or os.getenv("NEAR_DUP_DEFAULT_POLICY", "keep")).lower()
+        if self.default_policy not in POLICIES:
+            raise ValueError(f"Unsupported near-duplicate policy '{self.default_policy}'")
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self.totals = {
+            "chunks_seen": 0,
+            "skipped": 0,
+            "linked": 0,
+            "embedding_calls_saved": 0,
+            "rows_saved": 0
+        }
+
+    def get_policy(self, source_type: str) -> str:
+        return self.policies.get(source_type.lower().lstrip('.'), self.default_policy)
+
+    def _ensure_schema(self, cur):
+        if self._schema_ready:
+            return
+        band_columns = ",\n".join(f"band{i} INTEGER NOT NULL" for i in range(LSH_BANDS))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS {schema}.embedding_signatures (
+                collection TEXT NOT NULL DEFAULT '{default}',
+                document_hash TEXT NOT NULL,
+                canonical_hash TEXT,
+                source TEXT,
+                simhash BIGINT NOT NULL,
+                {bands},
+                created_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (collection, document_hash)
+            )
+        """.format(schema=self.schema, bands=band_columns, default=DEFAULT_COLLECTION))
+        cur.execute("""
+            ALTER TABLE {schema}.embedding_signatures
+            ADD COLUMN IF NOT EXISTS collection TEXT NOT NULL DEFAULT '{default}'
+        """.format(schema=self.schema, default=DEFAULT_COLLECTION))
+        for i in range(LSH_BANDS):
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS embedding_signatures_band{i}_idx
+                ON {schema}.embedding_signatures (band{i})
+            """.format(schema=self.schema, i=i))
+        self._schema_ready = True
+
+    def _fetch_candidates(
+        self,
+        cur,
+        band_values: List[List[int]],
+        collection: str,
+        source: str
+    ) -> Tuple[List[str], np.ndarray]:
+        """Load canonical signatures of the collection from other sources that share a band with the batch"""
+        conditions = " OR ".join(f"band{i} = ANY(%s)" for i in range(LSH_BANDS))
+        cur.execute("""
+            SELECT document_hash, simhash
+            FROM {schema}.embedding_signatures
+            WHERE collection = %s AND canonical_hash IS NULL
+              AND source IS DISTINCT FROM %s AND ({conditions})
+        """.format(schema=self.schema, conditions=conditions),
+            [collection, source] + [sorted({bands[i] for bands in band_values}) for i in range(LSH_BANDS)])
+        rows = cur.fetchall()
+        hashes = [row[0] for row in rows]
+        signatures = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+        return hashes, signatures
+
+    def filter_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        source: str,
+        source_type: str,
+        collection: str = DEFAULT_COLLECTION,
+        batch: Optional["DedupBatch"] = None
+    ) -> Dict[str, Any]:
+        """Split processor output into chunks to embed and near-duplicate links.
+
+        Files sharing a ``batch`` are filtered one at a time and match against
+        each other's unique chunks, which are not in the signature table until
+        they have been embedded and registered.
+
+        Returns a dict with ``chunks`` (to embed, each annotated with its
+        signature), ``links`` (pending pointers to canonical chunks),
+        ``batch_duplicates`` (skipped or linked chunks whose canonical is a batch
+        chunk that may still fail to store, with their ``canonical_hash``) and
+        ``report`` (counts of what was saved).
+        """
+        policy = self.get_policy(source_type)
+        report = {
+            "policy": policy,
+            "chunks_seen": len(chunks),
+            "skipped": 0,
+            "linked": 0,
+            "embedding_calls_saved": 0,
+            "rows_saved": 0
+        }
+        if not chunks:
+            return {"chunks": [], "links": [], "batch_duplicates": [], "report": report}
+
+        signatures = [compute_simhash(chunk["content"]) for chunk in chunks]
+        band_values = [lsh_bands(signature) for signature in signatures]
+
+        batch = batch or DedupBatch()
+        with batch.lock:
+            # keep never matches, so it needs no candidates
+            stored_hashes, stored_signatures = [], np.array([], dtype=np.uint64)
+            if policy != 'keep':
+                with psycopg2.connect(**self.db_params) as conn:
+                    with conn.cursor() as cur:
+                        self._ensure_schema(cur)
+                        stored_hashes, stored_signatures = self._fetch_candidates(cur, band_values, collection, source)
+                    conn.commit()
+
+            # Chunks accepted earlier in this file or by sibling files of the upload act as canonicals too
+            unique, links, batch_duplicates = [], [], []
+            for chunk, signature in zip(chunks, signatures):
+                doc_hash = hashlib.md5(chunk["content"].encode()).hexdigest()
+                canonical = None
+                if policy != 'keep':
+                    canonical = self._match(signature, stored_hashes, stored_signatures)
+                    if canonical is None:
+                        canonical = self._match(signature, batch.hashes, np.array(batch.signatures, dtype=np.uint64))
+                        if canonical is not None:
+                            batch_duplicates.append({
+                                **chunk, "document_hash": doc_hash, "simhash": signature, "canonical_hash": canonical
+                            })
+
+                if canonical is None:
+                    unique.append({**chunk, "document_hash": doc_hash, "simhash": signature})
+                    batch.hashes.append(doc_hash)
+                    batch.signatures.append(signature)
+                    continue
+
+                report["embedding_calls_saved"] += 1
+                report["rows_saved"] += 1
+                if policy == 'link':
+                    report["linked"] += 1
+                    links.append({
+                        "document_hash": doc_hash,
+                        "canonical_hash": canonical,
+                        "source": source,
+                        "simhash": signature
+                    })
+                else:
+                    report["skipped"] += 1
+
+        with self._lock:
+            for key in self.totals:
+                self.totals[key] += report[key]
+        return {"chunks": unique, "links": links, "batch_duplicates": batch_duplicates, "report": report}
+
+    def _match(self, signature: int, hashes: List[str], signatures: np.ndarray) -> Optional[str]:
+        if not hashes:
+            return None
+        distances = _hamming(signature, signatures)
+        best = int(np.argmin(distances))
+        return hashes[best] if distances[best] <= self.max_distance else None
+
+    def register(
+        self,
+        chunks: List[Dict[str, Any]],
+        links: List[Dict[str, Any]],
+        source: str,
+        collection: str = DEFAULT_COLLECTION
+    ):
+        """Persist signatures of stored chunks and near-duplicate links into the LSH index"""
+        rows = [
+            (chunk["document_hash"], None, source, chunk["simhash"]) for chunk in chunks
+        ] + [
+            (link["document_hash"], link["canonical_hash"], link["source"], link["simhash"]) for link in links
+        ]
+        if not rows:
+            return
+
+        band_columns = ", ".join(f"band{i}" for i in range(LSH_BANDS))
+        placeholders = ", ".join(["%s"] * (5 + LSH_BANDS))
+        with psycopg2.connect(**self.db_params) as conn:
+            with conn.cursor() as cur:
+                self._ensure_schema(cur)
+                cur.executemany("""
+                    INSERT INTO {schema}.embedding_signatures
+                    (collection, document_hash, canonical_hash, source, simhash, {bands})
+                    VALUES ({placeholders})
+                    ON CONFLICT DO NOTHING
+                """.format(schema=self.schema, bands=band_columns, placeholders=placeholders), [
+                    (collection, doc_hash, canonical, src, _to_signed(signature), *lsh_bands(signature))
+                    for doc_hash, canonical, src, signature in rows
+                ])
+            conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cumulative savings since process start"""
+        with self._lock:
+            return {
+                **self.totals,
+                "max_distance": self.max_distance,
+                "default_policy": self.default_policy,
+                "policies": self.policies
+            }
@@ -1,24 +1,95 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
 from langchain.embeddings import OpenAIEmbeddings
 import hashlib
 import json
+import threading
 from datetime import datetime
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from utils.db import get_db_params, wait_for_db
+from .query_cache import get_query_cache
+from .partitioning import EmbeddingPartitionManager, DEFAULT_COLLECTION, source_type_of
 import os
 
 class EmbeddingService:
     def __init__(self):
+        # No database I/O here: the app lifespan calls warm_up() once the service exists
         self.embeddings = OpenAIEmbeddings()
         self.db_params = get_db_params()
+        self.partitions = EmbeddingPartitionManager()
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises PoolError when exhausted instead of blocking,
+        # so borrowers queue here for a free slot (bounded by DB_POOL_TIMEOUT_SECONDS)
+        self.pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+        self._pool_slots = threading.BoundedSemaphore(self.pool_max)
+
+    def warm_up(self):
+        """Wait for the database, check the embeddings layout and prefill the connection pool"""
         if not wait_for_db(self.db_params):
             raise RuntimeError("Database connection failed")
+        self.partitions.check_layout()
+        self._get_pool()
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._pool_lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    int(os.getenv("DB_POOL_MIN", "2")),
+                    self.pool_max,
+                    **self.db_params
+                )
+            return self.pool
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Borrow a pooled connection for one transaction (commit on success, rollback on error).
+
+        Waits up to ``timeout`` (default DB_POOL_TIMEOUT_SECONDS) for a free
+        connection when all DB_POOL_MAX are in use. This blocks, so async code
+        must call it from a worker thread.
+        """
+        pool = self._get_pool()
+        timeout = self.pool_timeout if timeout is None else timeout
+        if not self._pool_slots.acquire(timeout=timeout):
+            raise RuntimeError(f"No database connection available after {timeout}s")
+        try:
+            conn = pool.getconn()
+            try:
+                with conn:
+                    yield conn
+            finally:
+                pool.putconn(conn)
+        finally:
+            self._pool_slots.release()
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """Cheap readiness probe against the pool; a saturated pool fails fast instead of hanging the probe"""
+        try:
+            with self.connection(timeout=timeout) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
 
     def generate_embeddings(self, content: str) -> List[float]:
         """Generate embeddings for a single piece of content"""
         return self.embeddings.embed_query(content)
 
-    def process_content(self, content: str, metadata: Dict[str, Any], source: str) -> Dict[str, Any]:
+    def process_content(
+        self,
+        content: str,
+        metadata: Dict[str, Any],
+        source: str,
+        collection: str = DEFAULT_COLLECTION
+    ) -> Dict[str, Any]:
         """Process a single piece of content and return document with embedding"""
         doc_hash = hashlib.md5(content.encode()).hexdigest()
         vector = self.generate_embeddings(content)
@@ -29,36 +100,62 @@ class EmbeddingService:
             "document_hash": doc_hash,
             "metadata": metadata,
             "source": source,
+            "collection": collection,
+            "source_type": source_type_of(source),
             "version": "1.0",
             "processed_at": datetime.now().isoformat()
         }
 
-    def store_embeddings(self, documents: List[Dict[str, Any]]) -> int:
-        """Store embeddings in database"""
+    def store_embeddings(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Store embeddings in database, writing each row straight into its partition.
+
+        Returns ``inserted_count`` and ``stored_hashes``: the document hashes that
+        are now in the table, whether inserted here or already present.
+        """
         schema = os.getenv("DBT_SCHEMA", "permanent")
         inserted_count = 0
+        stored_hashes = set()
 
-        with psycopg2.connect(**self.db_params) as conn:
+        # Partition DDL commits on its own connection before any row is written
+        targets = []
+        for doc in documents:
+            collection = doc.get("collection", DEFAULT_COLLECTION)
+            source_type = doc.get("source_type") or source_type_of(doc["source"])
+            targets.append((collection, source_type, self.partitions.ensure_partition(collection, source_type)))
+
+        with self.connection() as conn:
             with conn.cursor() as cur:
-                for doc in documents:
+                for doc, (collection, source_type, table) in zip(documents, targets):
+                    # A failed row must not abort the transaction the other rows commit in
+                    cur.execute("SAVEPOINT store_row")
                     try:
                         cur.execute("""
-                            INSERT INTO {}.embeddings 
-                            (content, embedding, document_hash, version, processed_at, source, metadata)
-                            VALUES (%s, %s::vector, %s, %s, %s, %s, %s)
-                            ON CONFLICT (document_hash) DO NOTHING
-                        """.format(schema), (
+                            INSERT INTO {}.{} 
+                            (content, embedding, document_hash, version, processed_at, source, metadata,
+                             collection, source_type)
+                            VALUES (%s, %s::vector, %s, %s, %s, %s, %s, %s, %s)
+                            ON CONFLICT DO NOTHING
+                        """.format(schema, table), (
                             doc["content"],
                             doc["embedding"],
                             doc["document_hash"],
                             doc["version"],
                             doc["processed_at"],
                             doc["source"],
-                            json.dumps(doc["metadata"])
+                            json.dumps(doc["metadata"]),
+                            collection,
+                            source_type
                         ))
                         if cur.rowcount > 0:
                             inserted_count += 1
+                        cur.execute("RELEASE SAVEPOINT store_row")
+                        stored_hashes.add(doc["document_hash"])
                     except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT store_row")
                         print(f"Error inserting embedding: {str(e)}")
-            conn.commit()
-        return inserted_count
\ No newline at end of file
+
+        # Cached search results may no longer reflect the corpus
+        query_cache = get_query_cache()
+        if inserted_count and query_cache is not None:
+            query_cache.invalidate()
+        return {"inserted_count": inserted_count, "stored_hashes": stored_hashes}
\ No newline at end of file
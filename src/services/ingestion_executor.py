@@ -0,0 +1,110 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+import time
+
+def parse_file(path: str, process_type: Optional[str] = None) -> Tuple[List[Dict[str, Any]], float]:
+    """Parse and chunk one file; runs inside a worker process.
+
+    Returns the processor output and the seconds spent, so the caller can
+    report parse time separately from time spent queued.
+    """
+    from processors.registry import ProcessorRegistry
+
+    started = time.perf_counter()
+    file_ext = os.path.splitext(path)[1].lower()
+    processor = ProcessorRegistry.get_processor(file_ext)()
+    if process_type and process_type not in processor.get_supported_process_types():
+        raise ValueError(
+            f"Unsupported process type '{process_type}' for {file_ext} files. "
+            f"Supported types: {', '.join(processor.get_supported_process_types())}"
+        )
+    chunks = processor.process(path, process_type=process_type)
+    return chunks, time.perf_counter() - started
+
+class IngestionExecutor:
+    """Fan the files of one upload out over a process pool.
+
+    CPU-bound parsing and chunking run in worker processes, while embedding
+    and storage (network bound) run in threads, so file N+1 is parsed while
+    file N is being embedded. A semaphore bounds the number of files in flight
+    per request to keep memory use predictable.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+        self.max_in_flight = max_in_flight or int(os.getenv("INGEST_MAX_IN_FLIGHT", str(self.max_workers * 2)))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the API's DB connections and client threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run(
+        self,
+        files: List[Tuple[str, str]],
+        process_type: Optional[str],
+        store: Callable[[str, List[Dict[str, Any]]], Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Parse each (filename, path) in the pool and hand its chunks to ``store``.
+
+        ``store`` is blocking and is run in a thread. Returns one result per file
+        in input order; failures are reported per file instead of aborting the
+        whole upload.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def ingest_one(filename: str, path: str) -> Dict[str, Any]:
+            started = time.perf_counter()
+            async with semaphore:
+                try:
+                    chunks, parse_seconds = await loop.run_in_executor(
+                        self.pool, parse_file, path, process_type
+                    )
+                    store_started = time.perf_counter()
+                    stored = await asyncio.to_thread(store, filename, chunks)
+                    # store may downgrade the status, e.g. to "partial" when some rows failed
+                    result = {"status": "success", **stored}
+                    result.update({
+                        "filename": filename,
+                        "chunks": len(chunks),
+                        "timings": {
+                            "parse_seconds": round(parse_seconds, 4),
+                            "embed_and_store_seconds": round(time.perf_counter() - store_started, 4),
+                            "total_seconds": round(time.perf_counter() - started, 4)
+                        }
+                    })
+                    return result
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM on a huge file); start a fresh pool for later requests
+                    self._pool = None
+                    return {
+                        "filename": filename,
+                        "status": "error",
+                        "error": "Parser worker process terminated unexpectedly",
+                        "timings": {"total_seconds": round(time.perf_counter() - started, 4)}
+                    }
+                except Exception as e:
+                    return {
+                        "filename": filename,
+                        "status": "error",
+                        "error": str(e),
+                        "timings": {"total_seconds": round(time.perf_counter() - started, 4)}
+                    }
+
+        return await asyncio.gather(*(ingest_one(filename, path) for filename, path in files))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,265 @@
+from typing import Optional, Set, Tuple
+import argparse
+import hashlib
+import os
+import re
+import threading
+import psycopg2
+from utils.db import get_db_params
+
+DEFAULT_COLLECTION = "default"
+_NAME_PATTERN = re.compile(r'^[a-z0-9_]{1,40}$')
+
+def validate_collection(collection: str) -> str:
+    """Collections become table names, so only allow short lowercase identifiers"""
+    collection = (collection or DEFAULT_COLLECTION).lower()
+    if not _NAME_PATTERN.match(collection):
+        raise ValueError(
+            f"Invalid collection '{collection}': use 1-40 lowercase letters, digits or underscores"
+        )
+    return collection
+
+def partition_name(*parts: str) -> str:
+    """Collision-free partition name that stays well under Postgres' 63-byte limit.
+
+    The readable prefix is truncated; the hash of the full key keeps names such
+    as ('a_b', 'c') and ('a', 'b_c') apart.
+    """
+    digest = hashlib.md5("\x00".join(parts).encode()).hexdigest()[:12]
+    return f"embeddings_{parts[0][:20]}_{digest}"
+
+def source_type_of(source: str) -> str:
+    """Partition-safe source type derived from a filename"""
+    source_type = os.path.splitext(source)[1].lstrip('.').lower()
+    return source_type if _NAME_PATTERN.match(source_type) else "other"
+
+class EmbeddingPartitionManager:
+    """Manage declarative partitions of ``<schema>.embeddings``.
+
+    The parent table is LIST-partitioned by ``collection``; when
+    EMBEDDINGS_PARTITION_BY_TYPE is enabled each collection is further
+    LIST-partitioned by ``source_type``. Every leaf partition gets its own HNSW
+    index, so index builds and vacuum scale with the partition, not the corpus.
+    """
+
+    def __init__(self, subpartition_by_type: Optional[bool] = None):
+        self.db_params = get_db_params()
+        self.schema = os.getenv("DBT_SCHEMA", "permanent")
+        if subpartition_by_type is None:
+            subpartition_by_type = os.getenv("EMBEDDINGS_PARTITION_BY_TYPE", "false").lower() in ("1", "true", "yes")
+        self.subpartition_by_type = subpartition_by_type
+        self._known: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def leaf_table(self, collection: str, source_type: str) -> str:
+        """Name of the partition a row with this collection/source type lands in"""
+        if self.subpartition_by_type:
+            return partition_name(collection, source_type)
+        return partition_name(collection)
+
+    def _create_leaf_index(self, cur, table: str):
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS {table}_hnsw_idx
+            ON {schema}.{table} USING hnsw (embedding vector_cosine_ops)
+        """.format(schema=self.schema, table=table))
+        # Keeps incremental dbt exports cheap
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS {table}_ts_idx
+            ON {schema}.{table} (processed_at)
+        """.format(schema=self.schema, table=table))
+        # Snapshot watermarks and freshness checks range-scan the server-assigned insert time
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS {table}_stored_idx
+            ON {schema}.{table} (stored_at)
+        """.format(schema=self.schema, table=table))
+        # The unique key leads with collection, so payload lookups by hash (snapshot hits) need their own index
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS {table}_hash_idx
+            ON {schema}.{table} (document_hash)
+        """.format(schema=self.schema, table=table))
+
+    def ensure_partition(self, collection: str, source_type: str) -> str:
+        """Create the partition(s) for a collection/source type if missing, return the leaf table.
+
+        The DDL runs and commits on its own connection before the key is cached,
+        so a concurrent writer never routes rows to a table it cannot see yet.
+        """
+        key = (collection, source_type)
+        leaf = self.leaf_table(collection, source_type)
+        if key in self._known:
+            return leaf
+
+        with self._lock:
+            if key in self._known:
+                return leaf
+            conn = psycopg2.connect(**self.db_params)
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        # Serialise DDL across API workers; IF NOT EXISTS alone races on the catalog
+                        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{self.schema}.embeddings",))
+                        self._create_partition(cur, collection, source_type)
+            finally:
+                conn.close()
+            self._known.add(key)
+        return leaf
+
+    def _create_partition(self, cur, collection: str, source_type: str):
+        """Issue the partition DDL inside the caller's transaction"""
+        leaf = self.leaf_table(collection, source_type)
+        collection_table = partition_name(collection)
+        if self.subpartition_by_type:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS {schema}.{table}
+                PARTITION OF {schema}.embeddings FOR VALUES IN (%s)
+                PARTITION BY LIST (source_type)
+            """.format(schema=self.schema, table=collection_table), (collection,))
+            # Unrecognised types share the collection's DEFAULT partition
+            bound = "DEFAULT" if source_type == "other" else "FOR VALUES IN (%s)"
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS {schema}.{table}
+                PARTITION OF {schema}.{parent} {bound}
+            """.format(schema=self.schema, table=leaf, parent=collection_table, bound=bound),
+                () if source_type == "other" else (source_type,))
+        else:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS {schema}.{table}
+                PARTITION OF {schema}.embeddings FOR VALUES IN (%s)
+            """.format(schema=self.schema, table=collection_table), (collection,))
+        self._create_leaf_index(cur, leaf)
+
+    def _embeddings_relkind(self, cur) -> Optional[Tuple[str]]:
+        cur.execute("""
+            SELECT c.relkind FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = 'embeddings'
+        """, (self.schema,))
+        return cur.fetchone()
+
+    def _has_stored_at(self, cur) -> bool:
+        cur.execute("""
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attname = 'stored_at' AND NOT attisdropped
+        """, (f"{self.schema}.embeddings",))
+        return cur.fetchone() is not None
+
+    def check_layout(self):
+        """Fail loudly at startup if ``embeddings`` has not been converted to the current partitioned layout.
+
+        Inserts into a partition of a plain heap table would otherwise fail row
+        by row. With EMBEDDINGS_AUTO_MIGRATE enabled the migration runs instead.
+        """
+        with psycopg2.connect(**self.db_params) as conn:
+            with conn.cursor() as cur:
+                row = self._embeddings_relkind(cur)
+                if row is None:
+                    problem = "missing"
+                elif row[0] != 'p':
+                    problem = "not partitioned"
+                elif not self._has_stored_at(cur):
+                    problem = "missing the stored_at column"
+                else:
+                    problem = None
+        conn.close()
+        if problem is None:
+            return
+        if os.getenv("EMBEDDINGS_AUTO_MIGRATE", "false").lower() in ("1", "true", "yes"):
+            self.migrate()
+            return
+        raise RuntimeError(
+            f"{self.schema}.embeddings is {problem}; "
+            "run `python -m services.partitioning migrate` or set EMBEDDINGS_AUTO_MIGRATE=true"
+        )
+
+    def migrate(self):
+        """Convert a plain heap ``embeddings`` table into the partitioned layout.
+
+        Existing rows are moved to the default collection; the old table is kept
+        as ``embeddings_legacy`` until it is dropped manually.
+        """
+        with psycopg2.connect(**self.db_params) as conn:
+            with conn.cursor() as cur:
+                # Workers starting together with EMBEDDINGS_AUTO_MIGRATE must not migrate twice
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{self.schema}.embeddings",))
+                row = self._embeddings_relkind(cur)
+                if row and row[0] == 'p':
+                    # Re-running migrate backfills columns and indexes added to the layout since.
+                    # A non-volatile default makes this a catalog-only change, existing
+                    # rows read the migration time
+                    if not self._has_stored_at(cur):
+                        cur.execute("""
+                            ALTER TABLE {}.embeddings
+                            ADD COLUMN stored_at TIMESTAMP NOT NULL DEFAULT now()
+                        """.format(self.schema))
+                    cur.execute("""
+                        SELECT c.relname FROM pg_partition_tree(%s::regclass) t
+                        JOIN pg_class c ON c.oid = t.relid
+                        WHERE t.isleaf
+                    """, (f"{self.schema}.embeddings",))
+                    for (leaf,) in cur.fetchall():
+                        self._create_leaf_index(cur, leaf)
+                    print(f"{self.schema}.embeddings is already partitioned; columns and leaf indexes are up to date")
+                    return
+
+                if row:
+                    cur.execute("ALTER TABLE {}.embeddings RENAME TO embeddings_legacy".format(self.schema))
+                    cur.execute("""
+                        SELECT atttypmod FROM pg_attribute
+                        WHERE attrelid = %s::regclass AND attname = 'embedding'
+                    """, (f"{self.schema}.embeddings_legacy",))
+                    dim = cur.fetchone()[0]
+                else:
+                    dim = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+                cur.execute("""
+                    CREATE TABLE {schema}.embeddings (
+                        content TEXT NOT NULL,
+                        embedding vector({dim}),
+                        document_hash TEXT NOT NULL,
+                        version TEXT,
+                        processed_at TIMESTAMP,
+                        source TEXT,
+                        metadata JSONB,
+                        collection TEXT NOT NULL DEFAULT '{default}',
+                        source_type TEXT NOT NULL DEFAULT 'other',
+                        -- Assigned by the server at insert; processed_at comes from the client
+                        stored_at TIMESTAMP NOT NULL DEFAULT now(),
+                        UNIQUE (collection, source_type, document_hash)
+                    ) PARTITION BY LIST (collection)
+                """.format(schema=self.schema, dim=dim, default=DEFAULT_COLLECTION))
+
+                if row:
+                    cur.execute("""
+                        SELECT DISTINCT lower(COALESCE(NULLIF(substring(source from '\\.([A-Za-z0-9_]+)$'), ''), 'other'))
+                        FROM {}.embeddings_legacy
+                    """.format(self.schema))
+                    for (source_type,) in cur.fetchall():
+                        self._create_partition(cur, DEFAULT_COLLECTION, source_type_of(f"legacy.{source_type}"))
+                    cur.execute("""
+                        INSERT INTO {schema}.embeddings
+                        (content, embedding, document_hash, version, processed_at, source, metadata, collection, source_type)
+                        SELECT content, embedding, document_hash, version, processed_at, source, metadata, %s,
+                               lower(COALESCE(NULLIF(substring(source from '\\.([A-Za-z0-9_]+)$'), ''), 'other'))
+                        FROM {schema}.embeddings_legacy
+                        ON CONFLICT DO NOTHING
+                    """.format(schema=self.schema), (DEFAULT_COLLECTION,))
+                    print(f"Moved {cur.rowcount} rows into {self.schema}.embeddings partitions")
+            conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage partitions of the embeddings table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="Convert the embeddings table to the partitioned layout")
+    create = subparsers.add_parser("create", help="Create the partition for a collection")
+    create.add_argument("collection")
+    create.add_argument("--source-type", default="other")
+    args = parser.parse_args()
+
+    manager = EmbeddingPartitionManager()
+    if args.command == "migrate":
+        manager.migrate()
+    else:
+        print(manager.ensure_partition(validate_collection(args.collection), args.source_type))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+from typing import List, Dict, Any, Optional, Hashable
+from functools import lru_cache
+import threading
+import time
+import os
+import numpy as np
+
+class SemanticQueryCache:
+    """In-memory cache of search results keyed by query embedding similarity.
+
+    Query embeddings are kept L2-normalised in a preallocated float32 matrix so a
+    lookup is a single matrix-vector product. Entries only match when the search
+    parameters (limit, threshold, ...) are identical to the cached ones.
+
+    ``generation`` increases on every invalidation; callers read it before
+    running a search and pass it to ``put`` so results computed against a
+    corpus that changed meanwhile are never cached.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: Optional[float] = None
+    ):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < similarity_threshold <= 1:
+            raise ValueError("similarity_threshold must be in (0, 1]")
+
+        self.capacity = capacity
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self._matrix = None
+        self._params: List[Optional[Hashable]] = [None] * self.capacity
+        self._results: List[Optional[List[Dict[str, Any]]]] = [None] * self.capacity
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._last_used = np.zeros(self.capacity, dtype=np.int64)
+        self._created_at = np.zeros(self.capacity, dtype=np.float64)
+        self._tick = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, embedding: List[float], params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Return cached results for the most similar query with matching params"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._tick += 1
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            if self.ttl_seconds is not None:
+                expired = self._valid & (self._created_at < time.time() - self.ttl_seconds)
+                self._valid[expired] = False
+
+            candidates = np.flatnonzero(self._valid)
+            if candidates.size:
+                candidates = candidates[[self._params[i] == params for i in candidates]]
+            if not candidates.size:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[candidates] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            slot = int(candidates[best])
+            self._last_used[slot] = self._tick
+            self.hits += 1
+            return self._results[slot]
+
+    def put(
+        self,
+        embedding: List[float],
+        params: Hashable,
+        results: List[Dict[str, Any]],
+        generation: Optional[int] = None
+    ):
+        """Store results, evicting the least recently used entry when full.
+
+        Results are dropped if the cache was invalidated since ``generation``.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._tick += 1
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # First entry (or embedding model changed) fixes the matrix width
+                self._reset()
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+            free = np.flatnonzero(~self._valid)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._matrix[slot] = vector
+            self._params[slot] = params
+            self._results[slot] = results
+            self._valid[slot] = True
+            self._last_used[slot] = self._tick
+            self._created_at[slot] = time.time()
+
+    def invalidate(self):
+        """Drop all cached entries, e.g. after new embeddings were ingested"""
+        with self._lock:
+            self._valid[:] = False
+            self._params = [None] * self.capacity
+            self._results = [None] * self.capacity
+            self.invalidations += 1
+            self.generation += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit-rate and occupancy metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "capacity": self.capacity,
+                "size": int(self._valid.sum()),
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+@lru_cache()
+def get_query_cache() -> Optional[SemanticQueryCache]:
+    """Process-wide cache shared by retrieval and ingestion, configured from the environment"""
+    if os.getenv("QUERY_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    # Other API workers only invalidate their own cache, so bound staleness by default
+    ttl = os.getenv("QUERY_CACHE_TTL_SECONDS", "300")
+    return SemanticQueryCache(
+        capacity=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+        similarity_threshold=float(os.getenv("QUERY_CACHE_SIMILARITY", "0.95")),
+        ttl_seconds=float(ttl) if ttl else None
+    )
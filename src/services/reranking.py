@@ -0,0 +1,57 @@
+from typing import List, Optional, Sequence
+import numpy as np
+
+def mmr_rerank(
+    query_embedding: Sequence[float],
+    candidate_vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    sources: Optional[Sequence[str]] = None,
+    max_per_source: Optional[int] = None
+) -> List[int]:
+    """Select k candidates by maximal marginal relevance, returning their indices in pick order.
+
+    ``lambda_mult`` trades relevance (1.0) against diversity (0.0). When
+    ``max_per_source`` is given, at most that many candidates are taken from
+    any one source. All similarities come from a single candidate Gram matrix,
+    so each greedy step is a handful of vector operations over the pool.
+    """
+    if not len(candidate_vectors) or k <= 0:
+        return []
+
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    candidates = candidates / norms
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    if query_norm > 0:
+        query = query / query_norm
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    if sources is not None and max_per_source:
+        _, source_codes = np.unique(np.asarray(sources, dtype=object).astype(str), return_inverse=True)
+        source_counts = np.zeros(source_codes.max() + 1, dtype=np.int32)
+    else:
+        source_codes = None
+
+    selected = []
+    for _ in range(min(k, len(candidates))):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+
+        if source_codes is not None:
+            code = source_codes[best]
+            source_counts[code] += 1
+            if source_counts[code] >= max_per_source:
+                available[source_codes == code] = False
+    return selected
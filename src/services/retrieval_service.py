@@ -1,34 +1,261 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .embedding_service import EmbeddingService
-import psycopg2
+from .query_cache import SemanticQueryCache, get_query_cache
+from .vector_snapshot import SnapshotSearchEngine
+from .partitioning import validate_collection
+from .reranking import mmr_rerank
+import numpy as np
+import asyncio
+import os
+import threading
+import time
+
+def decode_vectors(blobs: List[bytes]) -> np.ndarray:
+    """Decode pgvector binary values (``vector_send``) into a float32 matrix.
+
+    Each value is a 2-byte dimension, 2 unused bytes and big-endian float4s;
+    decoding the joined buffer at once avoids building a Python float per
+    component as ``embedding::real[]`` text parsing does.
+    """
+    raw = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), -1)
+    return raw[:, 4:].copy().view(">f4").astype(np.float32)
 
 class RetrievalService:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        query_cache: Optional[SemanticQueryCache] = None,
+        snapshot_engine: Optional[SnapshotSearchEngine] = None
+    ):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.query_cache = query_cache or get_query_cache()
+        if snapshot_engine is None and os.getenv("VECTOR_SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes"):
+            snapshot_engine = SnapshotSearchEngine()
+        self.snapshot_engine = snapshot_engine
+        self.schema = os.getenv("DBT_SCHEMA", "permanent")
+        self.freshness_check_seconds = float(os.getenv("CORPUS_FRESHNESS_CHECK_SECONDS", "5"))
+        self._state: Optional[Dict[str, Any]] = None
+        self._state_checked_at = 0.0
+        self._state_lock = threading.Lock()
+        self._cache_marker = None
 
     async def semantic_search(
         self,
         query: str,
         limit: int = 5,
-        threshold: float = 0.7
+        threshold: float = 0.7,
+        collection: Optional[str] = None,
+        fetch_k: Optional[int] = None,
+        mmr_lambda: Optional[float] = None,
+        max_per_source: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Perform semantic search with similarity threshold, optionally within one collection.
+
+        Setting any of fetch_k, mmr_lambda or max_per_source enables reranking:
+        fetch_k candidates (default 4x limit) are fetched with their vectors and
+        reduced to limit by maximal marginal relevance and per-source caps.
+        MMR diversifies (lambda 0.5) only when fetch_k or mmr_lambda is given;
+        max_per_source alone keeps pure relevance order (lambda 1.0).
+        """
+        if collection is not None:
+            collection = validate_collection(collection)
+        # Embedding, pooled DB reads (which may wait for a free connection) and the
+        # snapshot scan all block, so the whole search runs in a worker thread
+        return await asyncio.to_thread(
+            self._search, query, limit, threshold, collection, fetch_k, mmr_lambda, max_per_source
+        )
+
+    def _search(
+        self,
+        query: str,
+        limit: int,
+        threshold: float,
+        collection: Optional[str],
+        fetch_k: Optional[int],
+        mmr_lambda: Optional[float],
+        max_per_source: Optional[int]
     ) -> List[Dict[str, Any]]:
-        """Perform semantic search with similarity threshold"""
         query_embedding = self.embedding_service.generate_embeddings(query)
-        
-        with psycopg2.connect(**self.embedding_service.db_params) as conn:
+
+        cache_params = (limit, threshold, collection, fetch_k, mmr_lambda, max_per_source)
+        generation = None
+        if self.query_cache is not None:
+            self._sync_cache_with_corpus()
+            # Read before searching so a concurrent invalidation discards this result
+            generation = self.query_cache.generation
+            cached = self.query_cache.get(query_embedding, cache_params)
+            if cached is not None:
+                return cached
+
+        rerank = fetch_k is not None or mmr_lambda is not None or max_per_source is not None
+        pool_size = max(fetch_k or limit * 4, limit) if rerank else limit
+
+        if self._snapshot_is_current(len(query_embedding)):
+            results, vectors = self._search_snapshot(query_embedding, pool_size, threshold, collection, rerank)
+        else:
+            results, vectors = self._search_sql(query_embedding, pool_size, threshold, collection, rerank)
+
+        if rerank and results:
+            order = mmr_rerank(
+                query_embedding,
+                vectors,
+                k=limit,
+                lambda_mult=mmr_lambda if mmr_lambda is not None else (0.5 if fetch_k is not None else 1.0),
+                sources=[result['source'] for result in results],
+                max_per_source=max_per_source
+            )
+            results = [results[i] for i in order]
+
+        if self.query_cache is not None:
+            self.query_cache.put(query_embedding, cache_params, results, generation)
+        return results
+
+    def _corpus_state(self) -> Dict[str, Any]:
+        """Counts of recently stored rows, shared by every API worker through the database.
+
+        They are keyed on the server-assigned ``stored_at``, so a transaction that
+        commits late still changes them, unlike a max() over client timestamps.
+        ``cache_marker`` covers the last one to two hours (the window moves, and
+        so invalidates, once an hour); ``snapshot_count`` counts rows after the
+        snapshot's window start. Rechecked every CORPUS_FRESHNESS_CHECK_SECONDS
+        with an index range scan.
+        """
+        snapshot_since = self.snapshot_engine.window_start if self.snapshot_engine is not None else None
+        with self._state_lock:
+            if (self._state is None or self._state["snapshot_since"] != snapshot_since
+                    or time.monotonic() - self._state_checked_at > self.freshness_check_seconds):
+                with self.embedding_service.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            SELECT b.since,
+                                   count(e.stored_at) FILTER (WHERE e.stored_at > b.since),
+                                   count(e.stored_at) FILTER (WHERE e.stored_at > %s::timestamp),
+                                   max(e.stored_at)
+                            FROM (SELECT date_trunc('hour', now()::timestamp) - interval '1 hour' AS since) b
+                            LEFT JOIN {}.embeddings e ON e.stored_at > least(b.since, %s::timestamp)
+                            GROUP BY b.since
+                        """.format(self.schema), (snapshot_since, snapshot_since))
+                        since, recent_count, snapshot_count, latest = cur.fetchone()
+                self._state = {
+                    "snapshot_since": snapshot_since,
+                    "snapshot_count": snapshot_count if snapshot_since is not None else None,
+                    "cache_marker": (since, recent_count, latest)
+                }
+                self._state_checked_at = time.monotonic()
+            return self._state
+
+    def _sync_cache_with_corpus(self):
+        """Invalidate the cache when any worker has stored or deleted rows since the last check"""
+        marker = self._corpus_state()["cache_marker"]
+        if marker != self._cache_marker:
+            self.query_cache.invalidate()
+        self._cache_marker = marker
+
+    def _snapshot_is_current(self, dim: int) -> bool:
+        """Use the snapshot only if it is fresh and the table holds no rows it has not seen"""
+        if self.snapshot_engine is None or not self.snapshot_engine.is_available(dim):
+            return False
+        return self.snapshot_engine.covers(self._corpus_state()["snapshot_count"])
+
+    def _search_snapshot(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        threshold: float,
+        collection: Optional[str],
+        with_vectors: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Rank in-process against the memory-mapped snapshot, then fetch payloads by hash"""
+        hits = self.snapshot_engine.search(query_embedding, limit, threshold, collection, with_vectors)
+        if not hits:
+            return [], None
+
+        with self.embedding_service.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT document_hash, content, metadata, source
+                    FROM {}.embeddings
+                    WHERE document_hash = ANY(%s) {}
+                """.format(self.schema, "AND collection = %s" if collection else ""),
+                    ([hit[0] for hit in hits],) + ((collection,) if collection else ()))
+                rows = {row[0]: row[1:] for row in cur.fetchall()}
+
+        # Rows deleted since the snapshot was taken are simply dropped
+        hits = [hit for hit in hits if hit[0] in rows]
+        results = [{
+            'content': rows[hit[0]][0],
+            'metadata': rows[hit[0]][1],
+            'source': rows[hit[0]][2],
+            'similarity': hit[1]
+        } for hit in hits]
+        vectors = np.vstack([hit[2] for hit in hits]) if with_vectors and hits else None
+        return results, vectors
+
+    def _search_sql(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        threshold: float,
+        collection: Optional[str],
+        with_vectors: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        # A literal collection predicate lets Postgres prune to a single partition
+        collection_filter = "WHERE collection = %s" if collection else ""
+        params = (query_embedding,) + ((collection,) if collection else ()) + (query_embedding, limit, threshold)
+        with self.embedding_service.connection() as conn:
             with conn.cursor() as cur:
+                # The HNSW scan returns at most ef_search rows, so widen it for large candidate pools
+                cur.execute("SET LOCAL hnsw.ef_search = %s", (max(40, limit),))
+                # ORDER BY the raw distance with a LIMIT is what the HNSW index can serve;
+                # the similarity threshold is applied to the top-k afterwards
                 cur.execute("""
-                    SELECT content, metadata, source, 
-                           1 - (embedding <=> %s::vector) as similarity
-                    FROM permanent.embeddings
-                    WHERE 1 - (embedding <=> %s::vector) > %s
+                    SELECT content, metadata, source, similarity{vectors}
+                    FROM (
+                        SELECT content, metadata, source, embedding,
+                               1 - (embedding <=> %s::vector) AS similarity
+                        FROM {schema}.embeddings
+                        {collection_filter}
+                        ORDER BY embedding <=> %s::vector
+                        LIMIT %s
+                    ) nearest
+                    WHERE similarity > %s
                     ORDER BY similarity DESC
-                    LIMIT %s
-                """, (query_embedding, query_embedding, threshold, limit))
-                
-                return [{
-                    'content': row[0],
-                    'metadata': row[1],
-                    'source': row[2],
-                    'similarity': float(row[3])
-                } for row in cur.fetchall()]
+                """.format(
+                    vectors=", vector_send(embedding)" if with_vectors else "",
+                    schema=self.schema,
+                    collection_filter=collection_filter
+                ), params)
+                rows = cur.fetchall()
+
+        results = [{
+            'content': row[0],
+            'metadata': row[1],
+            'source': row[2],
+            'similarity': float(row[3])
+        } for row in rows]
+        vectors = decode_vectors([row[4] for row in rows]) if with_vectors and rows else None
+        return results, vectors
+
+    def warm_up(self):
+        """Map the vector snapshot and load ANN indexes into shared buffers"""
+        if self.snapshot_engine is not None:
+            self.snapshot_engine.prewarm()
+
+        if os.getenv("DB_PREWARM_INDEXES", "false").lower() in ("1", "true", "yes"):
+            try:
+                with self.embedding_service.connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            SELECT pg_prewarm(i.indexrelid::regclass)
+                            FROM pg_partition_tree(%s::regclass) t
+                            JOIN pg_index i ON i.indrelid = t.relid
+                            WHERE t.isleaf
+                        """, (f"{self.schema}.embeddings",))
+            except Exception as e:
+                print(f"Index prewarm skipped: {str(e)}")
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Return semantic query cache metrics"""
+        if self.query_cache is None:
+            return {"enabled": False}
+        return self.query_cache.get_stats()
@@ -0,0 +1,381 @@
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+import argparse
+import fcntl
+import json
+import os
+import time
+import numpy as np
+import psycopg2
+from utils.db import get_db_params
+
+# Data files are per generation: a full rebuild writes a new set and never
+# touches files that workers may still have mapped
+VECTORS_FILE = "vectors.{gen}.f32"
+IDS_FILE = "ids.{gen}.npy"
+COLLECTIONS_FILE = "collections.{gen}.npy"
+CENTROIDS_FILE = "centroids.{gen}.npy"
+ASSIGNMENTS_FILE = "assignments.{gen}.npy"
+GENERATION_FILES = (VECTORS_FILE, IDS_FILE, COLLECTIONS_FILE, CENTROIDS_FILE, ASSIGNMENTS_FILE)
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def _atomic_save_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def _kmeans(matrix: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on (a sample of) normalised rows, returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), size=min(len(matrix), n_lists * 256), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = sample[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+class VectorSnapshotExporter:
+    """Snapshot ``<schema>.embeddings`` into a memory-mappable float32 matrix.
+
+    The snapshot directory holds the row-major matrix of L2-normalised vectors
+    (``vectors.<gen>.f32``), sidecars mapping row offsets to document hashes and
+    collections (``ids.<gen>.npy``, ``collections.<gen>.npy``), optional IVF
+    centroids/assignments, and a ``manifest.json`` naming the current
+    generation. Incremental refreshes append past the published row count and
+    replace sidecars atomically; full rebuilds write a new generation. Only the
+    manifest is switched in place, so readers never observe a partial write.
+    Refreshes append rows stored since the manifest watermark.
+
+    The watermark is the server-assigned ``stored_at``. Its manifest also
+    records how many rows sit in the lookback window behind the watermark, so
+    search can tell when a transaction commits rows inside that window after
+    the refresh.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None, ivf_lists: Optional[int] = None, batch_size: int = 10000):
+        self.snapshot_dir = snapshot_dir or os.getenv("VECTOR_SNAPSHOT_DIR", "/tmp/vector_snapshot")
+        self.ivf_lists = ivf_lists if ivf_lists is not None else int(os.getenv("VECTOR_SNAPSHOT_IVF_LISTS", "0"))
+        self.batch_size = batch_size
+        # stored_at is assigned at insert, not commit, so rows can appear behind the
+        # watermark; each refresh re-scans this window (repeats are skipped)
+        self.lookback_seconds = float(os.getenv("VECTOR_SNAPSHOT_LOOKBACK_SECONDS", "600"))
+        self.schema = os.getenv("DBT_SCHEMA", "permanent")
+        self.db_params = get_db_params()
+
+    def _path(self, name: str, gen: Optional[int] = None) -> str:
+        return os.path.join(self.snapshot_dir, name.format(gen=gen))
+
+    def _remove_old_generations(self, current: int):
+        """Unlink superseded generations; existing mappings keep their inodes alive"""
+        for name in os.listdir(self.snapshot_dir):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) != current and \
+                    any(template.format(gen=parts[1]) == name for template in GENERATION_FILES):
+                os.remove(self._path(name))
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = self._path(MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(MANIFEST_FILE))
+
+    def _iter_rows(self, conn, since: Optional[str]):
+        """Stream (document_hash, stored_at, vector, collection) batches from a server-side cursor"""
+        with conn.cursor(name="vector_snapshot_export") as cur:
+            cur.itersize = self.batch_size
+            query = "SELECT document_hash, stored_at, embedding::real[], collection FROM {}.embeddings".format(
+                self.schema
+            )
+            params: Tuple = ()
+            if since:
+                query += " WHERE stored_at >= %s::timestamp - make_interval(secs => %s)"
+                params = (since, self.lookback_seconds)
+            cur.execute(query + " ORDER BY stored_at", params)
+            while True:
+                rows = cur.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def _count_window(self, conn, watermark: Optional[str]) -> Tuple[Optional[str], int]:
+        """Start of the lookback window behind the watermark and the rows stored in it"""
+        if watermark is None:
+            return None, 0
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT %s::timestamp - make_interval(secs => %s),
+                       (SELECT count(*) FROM {}.embeddings
+                        WHERE stored_at > %s::timestamp - make_interval(secs => %s))
+            """.format(self.schema), (watermark, self.lookback_seconds, watermark, self.lookback_seconds))
+            window_start, window_count = cur.fetchone()
+        return str(window_start), window_count
+
+    def refresh(self, full: bool = False) -> Dict[str, Any]:
+        """Bring the snapshot up to date, appending new rows unless a full rebuild is needed"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(self._path(LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            previous = self._read_manifest()
+            manifest = None if full else previous
+            if manifest is not None and (
+                manifest.get("ivf_lists", 0) != self.ivf_lists or "generation" not in manifest
+            ):
+                manifest = None
+            generation = previous.get("generation", 0) if previous else 0
+            if manifest is None:
+                generation += 1
+            result = self._refresh_locked(manifest, generation)
+            self._remove_old_generations(generation)
+            return result
+
+    def _refresh_locked(self, manifest: Optional[Dict[str, Any]], gen: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        if manifest is None:
+            count, dim, watermark = 0, None, None
+            ids = np.empty(0, dtype="S32")
+            collections = np.empty(0, dtype="S40")
+            mode = "wb"
+        else:
+            count, dim, watermark = manifest["count"], manifest["dim"], manifest["watermark"]
+            ids = np.load(self._path(IDS_FILE, gen))[:count]
+            collections = np.load(self._path(COLLECTIONS_FILE, gen))[:count]
+            mode = "r+b"
+
+        known = set(zip(ids.tolist(), collections.tolist())) if watermark else set()
+        new_ids, new_collections = [], []
+        conn = psycopg2.connect(**self.db_params)
+        try:
+            # One repeatable-read snapshot for the export and the window count, so the
+            # count matches exactly the rows this refresh has seen
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            with open(self._path(VECTORS_FILE, gen), mode) as f:
+                # Discard bytes past the published row count left by an interrupted refresh
+                f.truncate(count * (dim or 0) * 4)
+                f.seek(0, os.SEEK_END)
+                for rows in self._iter_rows(conn, watermark):
+                    # Rows arrive ordered by stored_at, so the last one is the new high-water mark
+                    watermark = str(rows[-1][1])
+                    rows = [row for row in rows if (row[0].encode(), row[3].encode()) not in known]
+                    if not rows:
+                        continue
+                    vectors = _normalize_rows(np.asarray([row[2] for row in rows], dtype=np.float32))
+                    if dim is None:
+                        dim = vectors.shape[1]
+                    f.write(vectors.astype(np.float32).tobytes())
+                    new_ids.extend(row[0] for row in rows)
+                    new_collections.extend(row[3] for row in rows)
+            window_start, window_count = self._count_window(conn, watermark)
+        finally:
+            conn.close()
+
+        appended = len(new_ids)
+        if appended:
+            ids = np.concatenate([ids, np.array(new_ids, dtype="S32")])
+            collections = np.concatenate([collections, np.array(new_collections, dtype="S40")])
+        count += appended
+
+        if self.ivf_lists and count and dim:
+            self._update_ivf(manifest, gen, count, dim, appended)
+
+        _atomic_save_npy(self._path(IDS_FILE, gen), ids)
+        _atomic_save_npy(self._path(COLLECTIONS_FILE, gen), collections)
+        manifest = {
+            "generation": gen,
+            "count": count,
+            "dim": dim,
+            "watermark": watermark,
+            "window_start": window_start,
+            "window_count": window_count,
+            "ivf_lists": self.ivf_lists,
+            "refreshed_at": time.time(),
+            "refreshed_at_iso": datetime.now().isoformat()
+        }
+        self._write_manifest(manifest)
+        return {**manifest, "appended": appended, "seconds": time.perf_counter() - started}
+
+    def _update_ivf(self, manifest: Optional[Dict[str, Any]], gen: int, count: int, dim: int, appended: int):
+        matrix = np.memmap(self._path(VECTORS_FILE, gen), dtype=np.float32, mode="r", shape=(count, dim))
+        if manifest is None or not os.path.exists(self._path(CENTROIDS_FILE, gen)):
+            centroids = _kmeans(np.asarray(matrix), min(self.ivf_lists, count))
+            _atomic_save_npy(self._path(CENTROIDS_FILE, gen), centroids)
+            start, assignments = 0, np.empty(0, dtype=np.int32)
+        else:
+            centroids = np.load(self._path(CENTROIDS_FILE, gen))
+            start = count - appended
+            assignments = np.load(self._path(ASSIGNMENTS_FILE, gen))[:start]
+
+        new_assignments = [
+            np.argmax(matrix[i:i + self.batch_size] @ centroids.T, axis=1).astype(np.int32)
+            for i in range(start, count, self.batch_size)
+        ]
+        _atomic_save_npy(self._path(ASSIGNMENTS_FILE, gen), np.concatenate([assignments, *new_assignments]))
+
+class SnapshotSearchEngine:
+    """In-process exact (or IVF-probed) top-k search over a memory-mapped snapshot.
+
+    The matrix is mapped read-only, so every worker process on the host shares
+    the same page-cache pages instead of holding its own copy.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None, max_age_seconds: Optional[float] = None, nprobe: Optional[int] = None):
+        self.snapshot_dir = snapshot_dir or os.getenv("VECTOR_SNAPSHOT_DIR", "/tmp/vector_snapshot")
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else float(
+            os.getenv("VECTOR_SNAPSHOT_MAX_AGE_SECONDS", "300")
+        )
+        self.nprobe = nprobe if nprobe is not None else int(os.getenv("VECTOR_SNAPSHOT_NPROBE", "8"))
+        self._manifest_mtime = None
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: Optional[np.ndarray] = None
+        self.collections: Optional[np.ndarray] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+
+    def _path(self, name: str, gen: Optional[int] = None) -> str:
+        return os.path.join(self.snapshot_dir, name.format(gen=gen))
+
+    def _maybe_reload(self):
+        try:
+            stat = os.stat(self._path(MANIFEST_FILE))
+            # The manifest is always replaced, so a new inode means a new version
+            mtime = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            self.manifest = None
+            return
+        if mtime == self._manifest_mtime:
+            return
+
+        with open(self._path(MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        count, dim = manifest["count"], manifest["dim"]
+        if not count or not dim:
+            self.manifest = None
+            return
+
+        gen = manifest.get("generation", 0)
+        try:
+            matrix = np.memmap(self._path(VECTORS_FILE, gen), dtype=np.float32, mode="r", shape=(count, dim))
+            ids = np.load(self._path(IDS_FILE, gen), mmap_mode="r")[:count]
+            collections = np.load(self._path(COLLECTIONS_FILE, gen), mmap_mode="r")[:count]
+            if manifest.get("ivf_lists"):
+                centroids = np.load(self._path(CENTROIDS_FILE, gen))
+                assignments = np.load(self._path(ASSIGNMENTS_FILE, gen), mmap_mode="r")[:count]
+            else:
+                centroids, assignments = None, None
+        except FileNotFoundError:
+            # A newer rebuild removed this generation between reading the manifest
+            # and mapping it; keep the current mapping and retry on the next call
+            return
+
+        self.matrix, self.ids, self.collections = matrix, ids, collections
+        self.centroids, self.assignments = centroids, assignments
+        self.manifest = manifest
+        self._manifest_mtime = mtime
+
+    def is_available(self, dim: Optional[int] = None) -> bool:
+        """True when a snapshot exists, matches the query width and is not stale"""
+        self._maybe_reload()
+        if self.manifest is None:
+            return False
+        if dim is not None and self.manifest["dim"] != dim:
+            return False
+        return time.time() - self.manifest["refreshed_at"] <= self.max_age_seconds
+
+    @property
+    def window_start(self) -> Optional[str]:
+        """Start of the lookback window whose row count the manifest recorded"""
+        return self.manifest.get("window_start") if self.manifest else None
+
+    def covers(self, window_count: Optional[int]) -> bool:
+        """True when the table holds exactly the rows after window_start that the snapshot saw.
+
+        Rows stored past the watermark, and rows committed late inside the window,
+        both raise the count; deletions lower it.
+        """
+        if self.window_start is None or window_count is None:
+            return False
+        return window_count == self.manifest.get("window_count")
+
+    def prewarm(self, batch_rows: int = 4096) -> bool:
+        """Fault the snapshot pages into the page cache ahead of the first query"""
+        self._maybe_reload()
+        if self.manifest is None:
+            return False
+        for start in range(0, len(self.matrix), batch_rows):
+            float(np.sum(self.matrix[start:start + batch_rows]))
+        return True
+
+    def search(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        threshold: float,
+        collection: Optional[str] = None,
+        with_vectors: bool = False
+    ) -> List[Tuple]:
+        """Return (document_hash, cosine similarity[, vector]) tuples above threshold, best first"""
+        self._maybe_reload()
+        if self.manifest is None:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mask = None
+        if self.centroids is not None:
+            probes = np.argsort(self.centroids @ query)[-self.nprobe:]
+            mask = np.isin(self.assignments, probes)
+        if collection is not None:
+            in_collection = self.collections == collection.encode()
+            mask = in_collection if mask is None else mask & in_collection
+
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            scores = self.matrix[rows] @ query
+        else:
+            rows = None
+            scores = self.matrix @ query
+
+        if scores.size > limit:
+            top = np.argpartition(scores, -limit)[-limit:]
+        else:
+            top = np.arange(scores.size)
+        top = top[np.argsort(scores[top])[::-1]]
+        top = top[scores[top] > threshold]
+        offsets = rows[top] if rows is not None else top
+        if with_vectors:
+            return [(self.ids[i].decode(), float(scores[j]), np.array(self.matrix[i])) for i, j in zip(offsets, top)]
+        return [(self.ids[i].decode(), float(scores[j])) for i, j in zip(offsets, top)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Export permanent.embeddings into a memory-mapped snapshot")
+    parser.add_argument("--full", action="store_true", help="Rebuild instead of appending new rows")
+    parser.add_argument("--dir", default=None, help="Snapshot directory (default: VECTOR_SNAPSHOT_DIR)")
+    parser.add_argument("--ivf-lists", type=int, default=None, help="Number of IVF partitions, 0 for exact search")
+    args = parser.parse_args()
+
+    exporter = VectorSnapshotExporter(snapshot_dir=args.dir, ivf_lists=args.ivf_lists)
+    print(json.dumps(exporter.refresh(full=args.full)))
+
+if __name__ == "__main__":
+    main()